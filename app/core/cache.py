@@ -2,6 +2,7 @@ import threading
 
 
 class Cache:
+    MAX_RESPONSE_BYTES = 4 * 1024 * 1024  # response cache size cap
 
     @staticmethod
     def __sanitize(device):
@@ -9,12 +10,28 @@ class Cache:
 
     def __init__(self):
         self.__active_devices = dict()
+        self.__active_repr = None  # memoized str() of active devices
         self.__active_schedulers = dict()
+        self.__device_uuids = dict()  # db device id -> uuid
+        self.__versions = dict()  # device id -> data version, None -> all devices
+        self.__generation = 0  # bumped to invalidate all device versions at once
+        self.__responses = dict()  # path -> (version, body, etag)
+        self.__responses_size = 0
         self.lock = threading.Lock()
 
     def get_all_active_devices(self):
         return list(self.__active_devices.values())
 
+    def get_all_active_devices_repr(self):
+        """Memoized tuple of str(device) for all active devices."""
+        active_repr = self.__active_repr
+        if active_repr is None:
+            with self.lock:
+                if self.__active_repr is None:
+                    self.__active_repr = tuple(str(d) for d in self.__active_devices.values())
+                active_repr = self.__active_repr
+        return active_repr
+
     def get_active_device(self, device, strict=False):
         return self.get_active_device_by_uuid(self.__sanitize(device).uuid, strict=strict)
 
@@ -27,14 +44,17 @@ class Cache:
     def add_active_device(self, device):
         with self.lock:
             self.__active_devices[device.uuid] = self.__sanitize(device)
+            self.__active_repr = None
 
     def remove_active_device(self, device):
         with self.lock:
             del self.__active_devices[device.uuid]
+            self.__active_repr = None
 
     def clear_devices(self):
         with self.lock:
             self.__active_devices.clear()
+            self.__active_repr = None
 
     def has_active_scheduler(self, uuid):
         return self.__active_schedulers.get(uuid) is not None \
@@ -49,11 +69,58 @@ class Cache:
             return  # not allowed more than 1
         with self.lock:
             self.__active_schedulers[uuid] = scheduler
+        self.invalidate_all()
 
     def remove_scheduler(self, uuid):
         if self.has_active_scheduler(uuid):
             with self.lock:
                 del self.__active_schedulers[uuid]
+            self.invalidate_all()
+
+    def uuid_for(self, device_id):
+        """UUID of a db device (by id), None if not known (yet)."""
+        return self.__device_uuids.get(device_id)
+
+    def set_device_uuid(self, device_id, uuid):
+        """Map db device id to its uuid, None removes the mapping."""
+        with self.lock:
+            if uuid is None:
+                self.__device_uuids.pop(device_id, None)
+            else:
+                self.__device_uuids[device_id] = uuid
+
+    def get_version(self, device_id=None):
+        """Data version of a device (or of all devices if device_id is None)."""
+        return self.__generation, self.__versions.get(device_id, 0)
+
+    def bump_version(self, device_id=None):
+        """Invalidate device's data version, 'all devices' version is always bumped."""
+        with self.lock:
+            self.__versions[None] = self.__versions.get(None, 0) + 1
+            if device_id is not None:
+                self.__versions[device_id] = self.__versions.get(device_id, 0) + 1
+
+    def invalidate_all(self):
+        """Invalidate all device versions (e.g. scheduler started/stopped)."""
+        with self.lock:
+            self.__generation += 1
+
+    def get_response(self, path, version):
+        """Return cached (body, etag) for the path, if cached with the same version."""
+        cached = self.__responses.get(path)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+
+    def put_response(self, path, version, body, etag):
+        with self.lock:
+            previous = self.__responses.pop(path, None)
+            if previous:
+                self.__responses_size -= len(previous[1])
+            if self.__responses_size + len(body) > self.MAX_RESPONSE_BYTES:
+                self.__responses.clear()
+                self.__responses_size = 0
+            self.__responses[path] = (version, body, etag)
+            self.__responses_size += len(body)
 
 
 CACHE = Cache()
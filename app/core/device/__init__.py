@@ -158,6 +158,8 @@ class Device(object):
     * device_type
     """
 
+    __slots__ = ()  # allow subclasses to use __slots__
+
     device_type = DeviceType.GENERIC
 
     def __init__(self):
@@ -1,10 +1,11 @@
-import glob
 import json
 import logging
+import os
 import re
 import termios
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from serial import Serial, SerialException
 
@@ -35,9 +36,11 @@ class DeviceNotRespondingException(DeviceException):
 
 class SerialDevice(Device):
 
+    __slots__ = ('port', 'baud', 'lock', 'serial', '_uuid')
+
     device_type = DeviceType.SERIAL
-    TIMEOUT = 5
-    WAIT_FOR_RESPONSE = 0.1
+    TIMEOUT = 5  # readline() blocks until a full response line or the timeout
+    BOOT_WAIT = 2  # opening the port resets the board
 
     __url_pattern = re.compile('^serial://(?P<port>[\w/-]+):(?P<baud>\d+)$')
 
@@ -46,7 +49,7 @@ class SerialDevice(Device):
         self.baud = baud
         self.lock = threading.Lock()
         self.serial = None
-        self.__uuid = None
+        self._uuid = None
         try:
             super(SerialDevice, self).__init__()
         except DeviceCommunicationException:
@@ -54,7 +57,7 @@ class SerialDevice(Device):
             pass
 
     def _get_uuid(self):
-        return self.__uuid
+        return self._uuid
 
     @staticmethod
     def port_baud(url: str):
@@ -72,12 +75,12 @@ class SerialDevice(Device):
         log.debug("Initializing {}".format(self))
         try:
             self.serial = Serial(self.port, self.baud, timeout=self.TIMEOUT)
-            time.sleep(2)  # serial takes time to be ready to receive
+            time.sleep(self.BOOT_WAIT)  # serial takes time to be ready to receive
 
             device_info = self._send_raw(self._simple_request(Command.STATUS))
             if device_info:
                 if "uuid" in device_info:
-                    self.__uuid = device_info['uuid']
+                    self._uuid = device_info['uuid']
                 else:
                     raise DeviceCommunicationException(
                         "Device info received, but without UUID field")
@@ -91,30 +94,29 @@ class SerialDevice(Device):
 
     # [!] one and only send method
     def _send_raw(self, request_dict):
-        if not self.serial:
+        ser = self.serial  # may be reset by another thread meanwhile
+        if not ser:
             raise DeviceCommunicationException("Serial is None. Connection wasn't initialized"
                                                "or was broken.")
         with self.lock:
             try:
-                self.serial.flush()
-                to_write = json.dumps(request_dict).encode('utf-8')
-                self.serial.write(to_write)
-                time.sleep(self.WAIT_FOR_RESPONSE)
-                response = self.serial.readline().decode("utf-8").rstrip()
+                # json.dumps escapes non-ascii by default, json.loads takes bytes
+                ser.write(json.dumps(request_dict).encode('ascii'))
+                response = ser.readline().rstrip()
                 if not response:
-                    self.__uuid = None
+                    self._uuid = None
                     raise DeviceCommunicationException(
                         "{}: response for '{}' not received..".format(self, request_dict))
 
                 return json.loads(response)
             except SerialException as e:
                 log.warning(e)
-                self.__uuid = None
+                self._uuid = None
                 self.serial = None
                 raise DeviceCommunicationException(e)
             except termios.error as e:
                 log.fatal("{}: device got probably disconnected".format(e))
-                self.__uuid = None
+                self._uuid = None
                 self.serial = None
                 raise DeviceCommunicationException("Device got probably disconnected.", e)
 
@@ -125,7 +127,7 @@ class SerialDevice(Device):
         return self.serial is not None
 
     def _is_responding(self):
-        return self.__uuid is not None
+        return self._uuid is not None
 
     def __str__(self):
         return self.__repr__()
@@ -135,32 +137,44 @@ class SerialDevice(Device):
 
 
 def get_connected_devices():
-    devices = glob.glob("/dev/{}*".format(serial_prefix))
+    # plain prefix match, no need for glob's fnmatch translation
+    with os.scandir("/dev") as entries:
+        devices = [entry.path for entry in entries if entry.name.startswith(serial_prefix)]
     log.info("Connected devices (prefix '{}'): {}".format(serial_prefix, devices))
     return devices
 
 
+def _probe(port):
+    """Try to initialize a serial device on the port, None if not responding."""
+    try:
+        device = SerialDevice(port, baud_rate)
+    except SerialException as e:
+        log.warning(e)
+        return None
+    if device.is_responding:
+        return device
+    log.warning("{} not responding.".format(device))
+    return None
+
+
 def scan(exclude=None):
     """
-    Run scan for all configured serial ports
+    Run scan for all configured serial ports, ports are probed in parallel
+    (each one takes a couple of seconds to initialize).
     """
     if not exclude:
         exclude = []
     log.info("Scanning for serial devices...")
-    found_devices = []
+    ports = []
     for port in get_connected_devices():
         if port in exclude:
             log.info("{}: skipping...".format(port))
             continue
-        try:
-            device = SerialDevice(port, baud_rate)
-        except SerialException as e:
-            log.warning(e)
-            continue
-        if device.is_responding:
-            found_devices.append(device)
-        else:
-            log.warning("{} not responding.".format(device))
+        ports.append(port)
+
+    found_devices = []
+    if ports:
+        with ThreadPoolExecutor(max_workers=min(16, len(ports))) as pool:
+            found_devices = [d for d in pool.map(_probe, ports) if d]
     log.info("Scan complete, found devices: {}".format(found_devices))
     return found_devices
-
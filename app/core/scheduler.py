@@ -118,6 +118,7 @@ class Scheduler:
         self.__running = False
         self.__should_be_running = False
         CACHE.remove_scheduler(self.device.uuid)
+        CACHE.invalidate_all()
         if message:
             self._set_scheduler_error(message)
 
@@ -131,6 +132,7 @@ class Scheduler:
         attempts = 0
         no_task_retry_limit = 0
         self.__running = True
+        CACHE.invalidate_all()  # 'scheduler_running' is part of device's data
         while self.__should_be_running:
             # 1) Health-check
             if not self.device.physical.health_check():
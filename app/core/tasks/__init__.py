@@ -73,6 +73,8 @@ class ScheduledTask:
                     next_ten_seconds = 0
                     next_minute = next_minute + 1 if next_minute < 59 else 0
                 time = time.replace(second=next_ten_seconds, minute=next_minute, microsecond=0)
+            elif not Task.is_valid_cron(task_db.cron):
+                raise TaskException(f"{task_db}: invalid cron definition '{task_db.cron}'")
             else:
                 time = croniter(task_db.cron).get_next(datetime)
             runnable = TaskRunnable.from_database_task(task_db)
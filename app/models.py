@@ -2,9 +2,12 @@ import json
 import logging
 import math
 from datetime import datetime
+from functools import lru_cache
+from itertools import chain
 
+from croniter import croniter
 from sqlalchemy import event, desc
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, selectinload, Session
 from sqlalchemy.orm.collections import InstrumentedList
 
 from app import db
@@ -102,9 +105,7 @@ class Sensor(Base):
     # history (=backref) - list of historic values
 
     device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
-    device = db.relationship('Device',
-                             backref=db.backref(
-                                 'sensors', lazy=False, cascade='all, delete-orphan'))
+    device = db.relationship('Device', back_populates='sensors')
 
     def __repr__(self):
         return f"<Sensor (name={self.name}, value={self.last_value} {self.unit}," \
@@ -160,16 +161,13 @@ class Sensor(Base):
             except (KeyError, AttributeError):
                 return None
 
+        # Query explicitly instead of loading the (potentially huge) 'history'
+        # collection into the session, and let the db do the sorting.
+        query = db.session.query(HistoryItem).filter(HistoryItem.sensor == self)
         if since:
-            history = db.session.query(HistoryItem) \
-                .filter(
-                    HistoryItem.sensor == self,
-                    HistoryItem.timestamp >= since
-                ).all()
-            history = [reduce_history_item(it) for it in history]
-        else:
-            history = [reduce_history_item(it) for it in self.history]
-        history.sort(key=lambda i: i['timestamp'])
+            query = query.filter(HistoryItem.timestamp >= since)
+        history = [reduce_history_item(it)
+                   for it in query.order_by(HistoryItem.timestamp).all()]
         if not history:
             return []
 
@@ -208,9 +206,7 @@ class Control(Base):
     input = db.Column(db.String(80), nullable=True)
 
     device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
-    device = db.relationship('Device',
-                             backref=db.backref(
-                                 'controls', lazy=False, cascade='all, delete-orphan'))
+    device = db.relationship('Device', back_populates='controls')
 
     def __repr__(self):
         return f"<Control (name={self.name}, device={self.device_id})>"
@@ -270,8 +266,7 @@ class Task(Base):
     sensor = relationship(Sensor, uselist=False)
 
     device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False)
-    device = db.relationship(
-        'Device', backref=db.backref('tasks', lazy=False, cascade='all, delete-orphan'))
+    device = db.relationship('Device', back_populates='tasks')
 
     def __repr__(self):
         s = self.sensor.name if self.sensor else "NaN"
@@ -308,6 +303,12 @@ class Task(Base):
         d["control"] = self.control.dictionary if self.control else None
         return d
 
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def is_valid_cron(cron):
+        """Cached, the same few cron definitions are shared by most of the tasks."""
+        return croniter.is_valid(cron)
+
     @staticmethod
     def set_success(task_id):
         t = db.session.query(Task).filter_by(id=task_id).first()
@@ -331,7 +332,10 @@ class Device(Base):
     """
     Device
     """
-    __items__ = None
+    # Explicit columns: walking __dict__ would also pick up (and serialize)
+    # whichever relationships happen to be loaded.
+    __items__ = Base.__items__ + ['uuid', 'name', 'url', 'type', 'is_online',
+                                  'scheduler_error', 'time_modified', 'last_seen_online']
 
     time_modified = db.Column(db.DateTime, nullable=True)
     last_seen_online = db.Column(db.DateTime, nullable=True)
@@ -345,9 +349,15 @@ class Device(Base):
 
     is_online = db.Column(db.Boolean(), default=False)
     scheduler_error = db.Column(db.String(80), nullable=True)
-    # sensors (=backref)
-    # controls (=backref)
-    # tasks (=backref)
+
+    # Lazy 'select' by default, list endpoints should eager-load explicitly
+    # (i.e. selectinload), see Device.eager_options().
+    sensors = db.relationship(Sensor, back_populates='device', lazy='select',
+                              cascade='all, delete-orphan')
+    controls = db.relationship(Control, back_populates='device', lazy='select',
+                               cascade='all, delete-orphan')
+    tasks = db.relationship(Task, back_populates='device', lazy='select',
+                            cascade='all, delete-orphan')
 
     # store any unrecognized device attributes (for later manual triage)
     _unknown_commands = db.Column(db.String(500), nullable=True)
@@ -371,6 +381,16 @@ class Device(Base):
         data[command] = value
         self._unknown_commands = json.dumps(data)
 
+    @staticmethod
+    def eager_options():
+        """Loader options covering everything touched by Device.dictionary."""
+        return (
+            selectinload(Device.sensors),
+            selectinload(Device.controls),
+            selectinload(Device.tasks).selectinload(Task.sensor),
+            selectinload(Device.tasks).selectinload(Task.control),
+        )
+
     def get_grow_system(self):
         if not self.grow_system:
             return None
@@ -492,3 +512,38 @@ class HistoryItem(Base):
 @event.listens_for(Device, "before_update")
 def my_before_insert_listener(mapper, connection, target):
     target.time_modified = datetime.utcnow()
+
+
+@event.listens_for(Session, "after_flush")
+def collect_modified_devices(session, flush_context):
+    """Remember which devices' data were modified, see bump_device_versions."""
+    modified = session.info.setdefault('modified_devices', set())
+    uuids = session.info.setdefault('device_uuids', dict())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, HistoryItem):
+            continue
+        elif isinstance(obj, Device):
+            modified.add(obj.id)
+            uuids[obj.id] = None if obj in session.deleted else obj.uuid
+        elif getattr(obj, 'device_id', None) is not None:
+            modified.add(obj.device_id)
+        else:
+            modified.add(None)  # can't tell, invalidate everything
+
+
+@event.listens_for(Session, "after_commit")
+def bump_device_versions(session):
+    """Invalidate cached device responses once the changes are committed."""
+    for device_id in session.info.pop('modified_devices', ()):
+        if device_id is None:
+            CACHE.invalidate_all()
+        else:
+            CACHE.bump_version(device_id)
+    for device_id, uuid in session.info.pop('device_uuids', {}).items():
+        CACHE.set_device_uuid(device_id, uuid)
+
+
+@event.listens_for(Session, "after_rollback")
+def clear_modified_devices(session):
+    session.info.pop('modified_devices', None)
+    session.info.pop('device_uuids', None)
@@ -2,8 +2,10 @@ import logging
 from datetime import datetime, timedelta
 from functools import lru_cache
 
-from croniter import croniter, CroniterNotAlphaError, CroniterBadCronError
-from flask import jsonify, request
+from flask import current_app, request
+from sqlalchemy import delete
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, raiseload, selectinload
 
 from app.core.plugins import plugin_manager
 from app.system import bp
@@ -12,21 +14,42 @@ from app.system.device_controller import (
     run_scheduler, register_device, scan_devices, refresh_devices
 )
 from app.core.cache import CACHE
+from app.utils import etag, cached_response, ojson
 from app.models import db, Device, Task, Control, Sensor, HistoryItem
 
 log = logging.getLogger(__name__)
 
+MAX_TASK_PAYLOAD = 64 * 1024  # bytes, reject before parsing
+
+
+def _commit():
+    """Commit the session, on failure roll back and return the error response."""
+    try:
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        log.error(f"Commit failed: {e}")
+        return f"Database error: '{e}'", 500
+
+
+def _strict(*options):
+    """Append raiseload('*') to the loader options in debug/testing, so that
+    an accidental lazy load (i.e. N+1) fails loudly instead of going unnoticed."""
+    if current_app.config.get('DEBUG') or current_app.config.get('TESTING'):
+        return options + (raiseload('*'),)
+    return options
 
-def _get_id(string_or_int):
-    if type(string_or_int) is int:
-        return string_or_int
-    elif type(string_or_int) is str:
-        return int(string_or_int)
-    else:
-        raise ValueError("Supplied id value must be 'str' or 'int'")
+
+@bp.after_request
+def invalidate_device_version(response):
+    """Any successful write invalidates the device's (and 'all devices') version."""
+    if request.method in ('POST', 'DELETE') and response.status_code < 400:
+        CACHE.bump_version((request.view_args or {}).get('device_id'))
+    return response
 
 
 @bp.route('/', methods=['GET'])
+@etag
 def root():
     # supported tasks
     # version
@@ -35,22 +58,27 @@ def root():
     data = {
         'version': '0.0.1',
         'up-time': 2123452,
-        'active devices': [str(d) for d in CACHE.get_all_active_devices()],
+        'active devices': CACHE.get_all_active_devices_repr(),
         'tasks': sorted(plugin_manager.available_tasks)
     }
-    return jsonify(data)
+    return ojson(data)
 
 
 @bp.route('/devices', methods=['GET'])
+@etag
+@cached_response
 def all_devices():
-    devices = db.session.query(Device).all()
+    devices = db.session.query(Device).options(*_strict(*Device.eager_options())).all()
     response = [d.dictionary for d in devices]
-    return jsonify(response)
+    return ojson(response)
 
 
 @bp.route('/devices/<int:device_id>', methods=['GET'])
+@etag
+@cached_response
 def get_device(device_id):
-    device = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
+    device = db.session.query(Device).options(*Device.eager_options()) \
+        .filter_by(id=device_id).first_or_404()
     data = device.dictionary
     # show only in single device resource
     data['grow_system'] = device.get_grow_system()
@@ -64,24 +92,24 @@ def get_device(device_id):
     if data.get('grow_system') and data['grow_system'].get('grow_properties'):
         data['grow_system']['grow_properties'] = sorted(
             data['grow_system']['grow_properties'], key=__sort_props)
-    return jsonify(data)
+    return ojson(data)
 
 
 @bp.route('/devices/<int:device_id>', methods=['DELETE'])
 def delete_device(device_id):
-    d = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    try:
-        db.session.delete(d)
-        db.session.commit()
-    except Exception as e:
-        return f"Delete failed '{e}'", 500
+    d = db.session.query(Device).filter_by(id=device_id).first_or_404()
+    db.session.delete(d)
+    if err := _commit():
+        return err
     return f"device '{device_id}' deleted.", 200
 
 
 @bp.route('/devices/<int:device_id>/sensors', methods=['GET'])
+@etag
 def get_device_sensors(device_id):
-    d = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    return jsonify([s.dictionary for s in d.sensors])
+    d = db.session.query(Device).options(*_strict(selectinload(Device.sensors))) \
+        .filter_by(id=device_id).first_or_404()
+    return ojson([s.dictionary for s in d.sensors])
 
 
 @lru_cache(maxsize=16)
@@ -90,11 +118,12 @@ def cached_call(current_hour, sensor_id, since_, count_):
     mostly doesn't need very precise data, it can sent rounded-up timestamps.
     In combination with the current hour datetime, the response can than
     be cached here, to further lower server load."""
-    sensor = db.session.query(Sensor).filter_by(id=_get_id(sensor_id)).first_or_404()
+    sensor = db.session.query(Sensor).filter_by(id=sensor_id).first_or_404()
     return sensor.get_last_values(since=since_, count=count_)
 
 
 @bp.route('/devices/<int:device_id>/sensors/<int:sensor_id>/history', methods=['GET'])
+@etag
 def get_device_sensor_history(device_id, sensor_id):
     # expect timestamp in MILLISECONDS, don't make any assumptions
     timestamp_millis_string = request.args.get("since")
@@ -116,103 +145,112 @@ def get_device_sensor_history(device_id, sensor_id):
     # Don't cache the most recent queries
     if (since_datetime and datetime.now() - since_datetime < timedelta(days=1, hours=12)) \
        or (count and count < 100):
-        sensor = db.session.query(Sensor).filter_by(id=_get_id(sensor_id)).first_or_404()
-        return jsonify(sensor.get_last_values(since=since_datetime, count=count)), 200
+        sensor = db.session.query(Sensor).filter_by(id=sensor_id).first_or_404()
+        return ojson(sensor.get_last_values(since=since_datetime, count=count)), 200
 
     # Cache the result with the current hour datetime as well.
     now = datetime.utcnow()
     now = datetime(now.year, now.month, now.day, now.hour, 0, 0)
     items = cached_call(now, sensor_id, since_datetime, count)
-    return jsonify(items), 200
+    return ojson(items), 200
 
 
 @bp.route('/devices/<int:device_id>/sensors/<int:sensor_id>/history', methods=['DELETE'])
 def clear_sensor_history(device_id, sensor_id):
-    sensor = db.session.query(Sensor).filter_by(id=_get_id(sensor_id)).first_or_404()
-    entire_history = db.session.query(HistoryItem).filter_by(sensor_id=sensor.id)
-    for item in entire_history:
-        db.session.delete(item)
-    db.session.commit()
+    db.session.query(Sensor.id).filter_by(id=sensor_id).first_or_404()
+    db.session.execute(delete(HistoryItem).where(HistoryItem.sensor_id == sensor_id))
+    if err := _commit():
+        return err
     return 'History cleared.', 200
 
 
 @bp.route('/devices/<int:device_id>/sensors/<int:sensor_id>', methods=['POST'])
 def post_device_sensor(device_id, sensor_id):
-    s = db.session.query(Sensor).filter_by(id=_get_id(sensor_id)).first_or_404()
-    data = request.json
+    s = db.session.query(Sensor).filter_by(id=sensor_id).first_or_404()
+    data = request.get_json(silent=True)
     if not data:
         return "No data received", 400
 
     if "description" in data:
         s.description = data["description"]
-        db.session.commit()
+        if err := _commit():
+            return err
         return f"'{s.name}' modified.", 200
 
     return f"'{s.name}' not modified.", 304
 
 
 @bp.route('/devices/<int:device_id>/controls', methods=['GET'])
+@etag
 def get_device_controls(device_id):
-    d = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    db.session.query()
-    return jsonify([c.dictionary for c in d.controls])
+    d = db.session.query(Device).options(*_strict(selectinload(Device.controls))) \
+        .filter_by(id=device_id).first_or_404()
+    return ojson([c.dictionary for c in d.controls])
 
 
 @bp.route('/devices/<int:device_id>/controls/<int:control_id>', methods=['POST'])
 def post_device_control(device_id, control_id):
-    db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    c = db.session.query(Control).filter_by(id=_get_id(control_id)).first_or_404()
-    data = request.json
+    c = db.session.query(Control).filter_by(id=control_id, device_id=device_id).first_or_404()
+    data = request.get_json(silent=True)
     if not data:
         return "No data received", 400
 
     if "description" in data:
         c.description = data["description"]
-        db.session.commit()
+        if err := _commit():
+            return err
         return f"'{c.name}' modified.", 200
 
     return f"'{c.name}' not modified.", 304
 
 
 @bp.route('/devices/<int:device_id>/tasks', methods=['GET'])
+@etag
 def get_device_tasks(device_id):
-    d = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    return jsonify([t.dictionary for t in d.tasks])
+    d = db.session.query(Device) \
+        .options(*_strict(selectinload(Device.tasks).selectinload(Task.sensor),
+                          selectinload(Device.tasks).selectinload(Task.control))) \
+        .filter_by(id=device_id).first_or_404()
+    return ojson([t.dictionary for t in d.tasks])
 
 
 @bp.route('/devices/<int:device_id>/tasks/<int:task_id>', methods=['DELETE'])
 def delete_device_task(device_id, task_id):
-    db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    task = db.session.query(Task).filter_by(id=_get_id(task_id)).first_or_404()
-    if task.locked:
+    result = db.session.execute(
+        delete(Task).where(Task.id == task_id, Task.device_id == device_id,
+                           Task.locked.isnot(True)))
+    if result.rowcount == 0:  # nothing deleted, tell why
+        db.session.query(Task.id).filter_by(id=task_id, device_id=device_id).first_or_404()
         return f"task '{task_id}' is locked.", 400
-    db.session.delete(task)
-    db.session.commit()
+    if err := _commit():
+        return err
     return f"task '{task_id}' deleted", 200
 
 
 @bp.route('/devices/<int:device_id>/tasks/<int:task_id>/pause', methods=['POST'])
 def pause_device_task(device_id, task_id):
-    db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    task = db.session.query(Task).filter_by(id=_get_id(task_id)).first_or_404()
+    task = db.session.query(Task).filter_by(id=task_id, device_id=device_id).first_or_404()
     task.paused = True
-    db.session.commit()
+    if err := _commit():
+        return err
     return f'Task {task_id} paused.', 200
 
 
 @bp.route('/devices/<int:device_id>/tasks/<int:task_id>/resume', methods=['POST'])
 def resume_device_task(device_id, task_id):
-    db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    task = db.session.query(Task).filter_by(id=_get_id(task_id)).first_or_404()
+    task = db.session.query(Task).filter_by(id=task_id, device_id=device_id).first_or_404()
     task.paused = False
-    db.session.commit()
+    if err := _commit():
+        return err
     return f'Task {task_id} resumed.', 200
 
 
 @bp.route('/devices/<int:device_id>/tasks', methods=['POST'])
 def post_device_tasks(device_id):
-    device = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    data = request.json
+    if request.content_length and request.content_length > MAX_TASK_PAYLOAD:
+        return "Payload too large", 413
+    device = db.session.query(Device).filter_by(id=device_id).first_or_404()
+    data = request.get_json(silent=True)
 
     if not data:
         return "No data received", 400
@@ -223,7 +261,7 @@ def post_device_tasks(device_id):
     # Are we creating a new item or modifying an existing one...?
     created = False
     if "id" in data:
-        task = db.session.query(Task).filter_by(id=data["id"]).first()
+        task = db.session.query(Task).filter_by(id=data["id"], device_id=device.id).first()
         if not task:
             return f"No such task '{data['id']}'for device {device.name}", 400
     else:
@@ -245,9 +283,7 @@ def post_device_tasks(device_id):
         task.sensor = sensor
 
     if data.get("cron"):
-        try:
-            croniter(data["cron"])
-        except (CroniterNotAlphaError, CroniterBadCronError):
+        if not Task.is_valid_cron(data["cron"]):
             return f"Invalid cron definition: '{data['cron']}'", 400
         task.cron = data.get("cron")
 
@@ -265,7 +301,8 @@ def post_device_tasks(device_id):
         task.task_metadata = data.get("meta")
 
     db.session.add(task)
-    db.session.commit()
+    if err := _commit():
+        return err
     task_info = f"<id={task.id}name={task.name}>"
 
     if created:  # start up the scheduler for the device
@@ -276,28 +313,24 @@ def post_device_tasks(device_id):
 
 @bp.route('/devices/<int:device_id>', methods=['POST'])
 def modify_device(device_id):
-    device = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    data = request.json
+    device = db.session.query(Device).filter_by(id=device_id).first_or_404()
+    data = request.get_json(silent=True)
     if not data:
         return "No data received", 400
 
-    modifiable = ["name"]  # makes sure it's a proper attribute
-    was_modified = False
-    for key, value in data.items():
-        if key not in modifiable:
-            continue
-        device.__setattr__(key, value)
-        was_modified = True
-    db.session.add(device)
-    db.session.commit()
-    return (f"{device} modified.", 200) if was_modified \
-        else (f"No changes", 200)
+    fields = {"name"} & data.keys()  # makes sure it's a proper attribute
+    if not fields:
+        return "No changes", 200
+    for key in fields:
+        setattr(device, key, data[key])
+    if err := _commit():
+        return err
+    return f"{device} modified.", 200
 
 
-@bp.route('/devices/<string:device_id>/action', methods=['POST'])
+@bp.route('/devices/<int:device_id>/action', methods=['POST'])
 def device_action(device_id):
-    device_db = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    data = request.json
+    data = request.get_json(silent=True)
     if not data:
         return "No data received", 400
 
@@ -305,8 +338,10 @@ def device_action(device_id):
         return "'control' field is required", 400
 
     control = db.session.query(Control) \
-        .filter_by(name=data["control"], device=device_db) \
+        .options(joinedload(Control.device)) \
+        .filter_by(name=data["control"], device_id=device_id) \
         .first_or_404(description=f"No such control {data['control']}")
+    device_db = control.device
     try:
         Controller(device_db).action(control, value=data.get('value', None))
         return f"{device_db.name}: '{control.name}' cmd success", 200
@@ -314,10 +349,10 @@ def device_action(device_id):
         return f"{device_db.name}: '{control.name}' cmd failed: {e}", 500
 
 
-@bp.route('/devices/<string:device_id>/categorize', methods=['POST'])
+@bp.route('/devices/<int:device_id>/categorize', methods=['POST'])
 def post_device_categorize(device_id):
-    device = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    data = request.json
+    device = db.session.query(Device).filter_by(id=device_id).first_or_404()
+    data = request.get_json(silent=True)
     if not data:
         return "No data received", 400
     name = data.get("name")
@@ -342,47 +377,57 @@ def post_device_categorize(device_id):
     cmds = device.unknown_commands
     del cmds[name]
     device.unknown_commands = cmds
-    db.session.commit()
+    if err := _commit():
+        return err
     return f"{t} successfully created", 201
 
 
-@bp.route('/devices/<string:device_id>/controls/<int:control_id>', methods=['DELETE'])
+@bp.route('/devices/<int:device_id>/controls/<int:control_id>', methods=['DELETE'])
 def delete_control(device_id, control_id):
-    device = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    control = db.session.query(Control).filter_by(id=_get_id(control_id)).first_or_404()
+    control = db.session.query(Control).options(joinedload(Control.device)) \
+        .filter_by(id=control_id, device_id=device_id).first_or_404()
+    device = control.device
 
     name = control.name
     device.put_unknown_command(name, control.state)
     db.session.delete(control)
-    db.session.commit()
+    if err := _commit():
+        return err
     return f"'{name}' deleted.", 200
 
 
-@bp.route('/devices/<string:device_id>/sensors/<int:sensor_id>', methods=['DELETE'])
+@bp.route('/devices/<int:device_id>/sensors/<int:sensor_id>', methods=['DELETE'])
 def delete_sensor(device_id, sensor_id):
-    device = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
-    sensor = db.session.query(Sensor).filter_by(id=_get_id(sensor_id)).first_or_404()
+    sensor = db.session.query(Sensor).options(joinedload(Sensor.device)) \
+        .filter_by(id=sensor_id, device_id=device_id).first_or_404()
+    device = sensor.device
 
     name = sensor.name
     device.put_unknown_command(name, sensor.last_value)
+    # bulk delete, ORM cascade would load the entire history first
+    db.session.execute(delete(HistoryItem).where(HistoryItem.sensor_id == sensor.id))
     db.session.delete(sensor)
-    db.session.commit()
+    if err := _commit():
+        return err
     return f"'{name}' deleted.", 200
 
 
-@bp.route('/devices/<string:device_id>/scheduler', methods=['POST'])
+@bp.route('/devices/<int:device_id>/scheduler', methods=['POST'])
 def device_run_scheduler(device_id):
-    device_db = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
+    uuid = CACHE.uuid_for(device_id)
+    if uuid is None:
+        uuid = db.session.query(Device).filter_by(id=device_id).first_or_404().uuid
+        CACHE.set_device_uuid(device_id, uuid)
     try:
-        run_scheduler(device_db.uuid)
+        run_scheduler(uuid)
     except ControllerError as e:
         return f"{e}", 500
-    return f"'{device_db.name}' executor started.", 200
+    return f"'{uuid}' executor started.", 200
 
 
 @bp.route('/devices/register', methods=['POST'])
 def route_register_device():
-    data = request.json
+    data = request.get_json(silent=True)
     if not data or 'url' not in data or data.get('url') is None:
         return "'url' field needed.", 400
 
@@ -401,11 +446,11 @@ def route_scan_devices():
     return f"Scan complete, {len(found_devices)} found devices {found_devices}.", 200
 
 
-@bp.route('/devices/<string:device_id>/refresh', methods=['POST'])
+@bp.route('/devices/<int:device_id>/refresh', methods=['POST'])
 def route_refresh_device(device_id):
     """Performs the 'init' operation - iterates through DB stored devices and tries
     to initialize them and store in cache (if not already there)."""
-    device_db = db.session.query(Device).filter_by(id=_get_id(device_id)).first_or_404()
+    device_db = db.session.query(Device).filter_by(id=device_id).first_or_404()
     try:
         refresh_devices(devices=[device_db])
     except ControllerError as e:
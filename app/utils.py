@@ -1,5 +1,12 @@
+import hashlib
 import logging
 import traceback
+from functools import wraps
+
+import orjson
+from flask import Response, make_response, request
+
+from app.core.cache import CACHE
 
 
 log = logging.getLogger(__name__)
@@ -15,3 +22,57 @@ def parse_id_as_int(string_or_int):
             traceback.print_exc()
     log.error("Supplied id value must be 'str' or 'int'")
     return None
+
+
+def ojson(obj):
+    """Faster 'jsonify' replacement (orjson), datetime is serialized as ISO 8601."""
+    return Response(orjson.dumps(obj), mimetype='application/json')
+
+
+def _make_etag(body, version):
+    return hashlib.md5(body + str(version).encode()).hexdigest()
+
+
+def etag(f):
+    """Set a strong ETag on successful GET responses and answer '304 Not Modified'
+    if the client already has it. Device's data version (see CACHE.bump_version)
+    is mixed in, so that writes propagate immediately."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+
+        tag, _ = response.get_etag()  # already set by cached_response
+        if not tag:
+            tag = _make_etag(response.get_data(), CACHE.get_version(kwargs.get('device_id')))
+        if tag in request.if_none_match:
+            response = make_response('', 304)
+        response.set_etag(tag)
+        return response
+    return wrapper
+
+
+def cached_response(f):
+    """Cache successful GET responses in-process until device's data version
+    changes. Use below @etag."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        # version must be read before the data, a concurrent write then
+        # only makes the stored entry outdated, never stale.
+        version = CACHE.get_version(kwargs.get('device_id'))
+        cached = CACHE.get_response(request.full_path, version)
+        if cached:
+            body, tag = cached
+            response = Response(body, mimetype='application/json')
+            response.set_etag(tag)
+            return response
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            body = response.get_data()
+            tag = _make_etag(body, version)
+            CACHE.put_response(request.full_path, version, body, tag)
+            response.set_etag(tag)
+        return response
+    return wrapper
@@ -1,8 +1,10 @@
+import mock
 import pytest
 
 from app.system.device_controller import refresh_devices
 from app.core.cache import CACHE
 from app.core.device import DeviceException
+from app.core.device import serial
 from app.core.device.serial import SerialDevice
 
 
@@ -34,6 +36,18 @@ def test_init_negative(port, baud):
     assert not dev.is_responding
 
 
+def test_scan_skips_unresponsive_and_excluded():
+    ports = ["/dev/ttyUSB0", "/dev/ttyUSB1", "/dev/ttyUSB2"]
+
+    def _device(port, baud):
+        return mock.Mock(port=port, is_responding=port != "/dev/ttyUSB1")
+
+    with mock.patch.object(serial, "get_connected_devices", return_value=ports), \
+            mock.patch.object(serial, "SerialDevice", side_effect=_device):
+        found = serial.scan(exclude=["/dev/ttyUSB2"])
+    assert [d.port for d in found] == ["/dev/ttyUSB0"]
+
+
 @pytest.mark.parametrize("invalid_control", [None, 12, "c"])
 def test_send_control_negative(actual_serial_device, invalid_control):
     with pytest.raises(DeviceException):
@@ -25,3 +25,11 @@ def test_remove(mocked_device):
 @pytest.mark.parametrize("uuid", [None, 123, -100, "", "122adas"])
 def test_get_negative(uuid):
     assert CACHE.get_active_device_by_uuid(uuid) is None
+
+
+def test_active_devices_repr(mocked_device):
+    CACHE.add_active_device(mocked_device)
+    active = CACHE.get_all_active_devices_repr()
+    assert str(mocked_device) in active
+    CACHE.remove_active_device(mocked_device)
+    assert len(CACHE.get_all_active_devices_repr()) == len(active) - 1
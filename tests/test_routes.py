@@ -4,7 +4,7 @@ import time
 from app.system.device_controller import *
 from app.core.cache import CACHE
 from app.core.tasks import TaskType
-from app.models import Task, HistoryItem
+from app.models import Task, HistoryItem, Sensor
 
 
 def test_root(app_setup):
@@ -23,6 +23,23 @@ def test_get_devices(db_setup, app_setup, mocked_device):
         assert r.status_code == 200
 
 
+def test_get_devices_no_lazy_load(app_setup, mocked_device_with_sensor_and_control,
+                                  task_factory):
+    """raiseload('*') is active under TestConfig, any relationship missed
+    by the eager loading options would fail the request."""
+    device, sensor, control = mocked_device_with_sensor_and_control
+    task_factory(device, 'status', sensor=sensor, control=control)
+    db.session.expire_all()
+    with app_setup.test_client() as client:
+        for url in ["/devices", f"/devices/{device.id}/sensors",
+                    f"/devices/{device.id}/controls", f"/devices/{device.id}/tasks"]:
+            r = client.get(url)
+            assert r.status_code == 200, url
+        r = client.get("/devices")
+    assert r.json[0]['tasks'][0]['sensor']['name'] == sensor.name
+    assert r.json[0]['tasks'][0]['control']['name'] == control.name
+
+
 def test_post_task(app_setup, mocked_device, mocked_device_and_db):
     """Test that posting a new task starts up the scheduler."""
     CACHE.add_active_device(mocked_device)
@@ -37,6 +54,25 @@ def test_post_task(app_setup, mocked_device, mocked_device_and_db):
     assert CACHE.has_active_scheduler(mocked_device.uuid)
 
 
+def test_post_task_invalid_cron(app_setup, mocked_device_and_db):
+    url = f"/devices/{mocked_device_and_db.id}/tasks"
+    data = {"type": TaskType.STATUS.value, "cron": "* * not-a-cron"}
+    with app_setup.test_client() as client:
+        r = client.post(url, json=data)
+        assert r.status_code == 400
+        assert 'Invalid cron' in r.data.decode()
+
+
+def test_post_task_bad_payload(app_setup, mocked_device_and_db):
+    url = f"/devices/{mocked_device_and_db.id}/tasks"
+    with app_setup.test_client() as client:
+        r = client.post(url, data="{not json", content_type="application/json")
+        assert r.status_code == 400
+        assert r.data.decode() == "No data received"
+        r = client.post(url, json={"type": "status", "name": "x" * 64 * 1024})
+        assert r.status_code == 413
+
+
 def test_post_run_scheduler(app_setup, mocked_device, mocked_device_and_db):
     CACHE.add_active_device(mocked_device)
     url = f"/devices/{mocked_device_and_db.id}/scheduler"
@@ -66,6 +102,15 @@ def test_pause_task(app_setup, mocked_device_and_db, task_factory):
     assert db.session.query(Task).filter_by(id=task.id).first().paused
 
 
+def test_pause_task_wrong_device(app_setup, mocked_device_and_db, task_factory):
+    task = task_factory(mocked_device_and_db, 'status')
+    url = f"/devices/{mocked_device_and_db.id + 1}/tasks/{task.id}/pause"
+    with app_setup.test_client() as client:
+        r = client.post(url)
+        assert r.status_code == 404
+    assert not db.session.query(Task).filter_by(id=task.id).first().paused
+
+
 def test_resume_task(app_setup, mocked_device_and_db, task_factory):
     task = task_factory(mocked_device_and_db, 'status', paused=True)
     assert task.paused
@@ -90,3 +135,94 @@ def test_get_sensor_history(app_setup, mocked_device_with_sensor_and_control):
     assert response.status_code == 200
     assert type(response.json) is list
     assert len(response.json) == 100
+
+
+def test_get_device_etag(app_setup, mocked_device_and_db):
+    url = f"/devices/{mocked_device_and_db.id}"
+    with app_setup.test_client() as client:
+        r = client.get(url)
+        assert r.status_code == 200
+        tag = r.headers['ETag']
+
+        r = client.get(url, headers={'If-None-Match': tag})
+        assert r.status_code == 304
+        assert not r.data
+
+        # a write invalidates the tag
+        r = client.post(url, json={'name': 'renamed'})
+        assert r.status_code == 200
+        r = client.get(url, headers={'If-None-Match': tag})
+        assert r.status_code == 200
+        assert r.headers['ETag'] != tag
+
+
+def test_get_device_cached(app_setup, mocked_device_with_sensor_and_control):
+    device, sensor, control = mocked_device_with_sensor_and_control
+    url = f"/devices/{device.id}"
+    with app_setup.test_client() as client:
+        first = client.get(url)
+        assert first.status_code == 200
+        assert client.get(url).data == first.data
+
+        # e.g. a scheduled status task updating the sensor outside of any route
+        sensor.last_value = 42
+        db.session.commit()
+        r = client.get(url)
+    assert r.headers['ETag'] != first.headers['ETag']
+    assert r.json['sensors'][0]['last_value'] == 42
+
+
+def test_delete_control(app_setup, mocked_device_and_db):
+    device = mocked_device_and_db
+    control = Control(device=device, name="switch_02", input="bool", value="True")
+    db.session.add(control)
+    db.session.commit()
+    with app_setup.test_client() as client:
+        r = client.delete(f"/devices/{device.id + 1}/controls/{control.id}")
+        assert r.status_code == 404
+        r = client.delete(f"/devices/{device.id}/controls/{control.id}")
+        assert r.status_code == 200
+    assert not db.session.query(Control).filter_by(id=control.id).first()
+    assert "switch_02" in db.session.query(Device).get(device.id).unknown_commands
+
+
+def test_run_scheduler_deleted_device(app_setup, mocked_device_and_db):
+    device_id = mocked_device_and_db.id
+    assert CACHE.uuid_for(device_id) == mocked_device_and_db.uuid
+    with app_setup.test_client() as client:
+        r = client.delete(f"/devices/{device_id}")
+        assert r.status_code == 200
+        assert CACHE.uuid_for(device_id) is None
+        r = client.post(f"/devices/{device_id}/scheduler")
+        assert r.status_code == 404
+
+
+def test_delete_task(app_setup, mocked_device_and_db):
+    task = Task(device=mocked_device_and_db, type='status')
+    db.session.add(task)
+    db.session.commit()
+    url = f"/devices/{mocked_device_and_db.id}/tasks/{task.id}"
+    with app_setup.test_client() as client:
+        assert client.delete(url).status_code == 200
+        assert client.delete(url).status_code == 404
+    assert not db.session.query(Task).filter_by(id=task.id).first()
+
+
+def test_delete_sensor_with_history(app_setup, mocked_device_and_db):
+    sensor = Sensor(device=mocked_device_and_db, name="temp_02")
+    for _ in range(10):
+        db.session.add(HistoryItem(sensor=sensor, _value=1, timestamp=datetime.datetime.utcnow()))
+    db.session.commit()
+    assert len(sensor.history) == 10  # loaded in the session
+
+    with app_setup.test_client() as client:
+        r = client.delete(f"/devices/{mocked_device_and_db.id}/sensors/{sensor.id}")
+        assert r.status_code == 200
+    assert not db.session.query(Sensor).filter_by(name="temp_02").first()
+    assert not db.session.query(HistoryItem).count()
+
+
+def test_non_numeric_device_id(app_setup):
+    with app_setup.test_client() as client:
+        assert client.post("/devices/abc/scheduler").status_code == 404
+        assert client.post("/devices/abc/refresh").status_code == 404